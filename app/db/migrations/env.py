@@ -2,6 +2,7 @@ import os
 from logging.config import fileConfig
 
 from sqlalchemy import engine_from_config
+from sqlalchemy import event
 from sqlalchemy import pool
 
 from alembic import context
@@ -9,12 +10,15 @@ from alembic import context
 os.environ.setdefault("REBECCA_SKIP_RUNTIME_INIT", "1")
 
 from app.db.base import Base
+from app.db.migrations.safe_ops import reset_cache
 from config import SQLALCHEMY_DATABASE_URL
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
-config.set_main_option('sqlalchemy.url', SQLALCHEMY_DATABASE_URL)
+# a URL set by the caller (e.g. the migration tests) wins over the app setting
+if not config.get_main_option('sqlalchemy.url'):
+    config.set_main_option('sqlalchemy.url', SQLALCHEMY_DATABASE_URL)
 
 # Interpret the config file for Python logging.
 # This line sets up loggers basically.
@@ -57,26 +61,69 @@ def run_migrations_offline() -> None:
         context.run_migrations()
 
 
+def _enable_sqlite_transactional_ddl(engine) -> None:
+    """Let SQLite run the whole upgrade in one real transaction.
+
+    pysqlite only opens a transaction before DML, so DDL statements would
+    otherwise autocommit (and sync to disk) one by one. Taking over BEGIN
+    ourselves makes DDL transactional, as described in the SQLAlchemy
+    pysqlite documentation.
+    """
+
+    @event.listens_for(engine, "connect")
+    def _disable_pysqlite_begin(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def _emit_begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
+
+def _run_migrations(connection, transactional_ddl=None) -> None:
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        # each revision may change the schema, so drop cached reflection
+        on_version_apply=reset_cache,
+        transactional_ddl=transactional_ddl,
+    )
+
+    # The caches are keyed by id(connection); never let them outlive a run,
+    # including one aborted by a failing revision.
+    reset_cache()
+    try:
+        with context.begin_transaction():
+            context.run_migrations()
+    finally:
+        reset_cache()
+
+
 def run_migrations_online() -> None:
     """Run migrations in 'online' mode.
 
     In this scenario we need to create an Engine
     and associate a connection with the context.
+    A caller may instead hand over an open connection
+    through ``config.attributes["connection"]``.
 
     """
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        _run_migrations(connection)
+        return
+
     connectable = engine_from_config(
         config.get_section(config.config_ini_section),
         prefix="sqlalchemy.",
         poolclass=pool.NullPool,
     )
+    sqlite = connectable.dialect.name == "sqlite"
+    if sqlite:
+        _enable_sqlite_transactional_ddl(connectable)
 
     with connectable.connect() as connection:
-        context.configure(
-            connection=connection, target_metadata=target_metadata
-        )
-
-        with context.begin_transaction():
-            context.run_migrations()
+        # see _enable_sqlite_transactional_ddl
+        _run_migrations(connection, transactional_ddl=True if sqlite else None)
 
 
 if context.is_offline_mode():
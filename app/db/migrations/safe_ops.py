@@ -1,9 +1,17 @@
 from __future__ import annotations
 
-from typing import Iterable, Mapping
+import contextlib
+import functools
+from typing import Iterable, Iterator, Mapping
 
 import sqlalchemy as sa
 from alembic import op
+from sqlalchemy.engine import Inspector
+
+# Reflection state is cached per connection (keyed by ``id(bind)``) so that
+# repeated existence checks within a migration run don't re-query the catalog.
+_INSPECTOR_CACHE: dict[int, Inspector] = {}
+_METADATA_CACHE: dict[int, sa.MetaData] = {}
 
 
 def get_bind():
@@ -11,42 +19,217 @@ def get_bind():
     return op.get_bind()
 
 
-def inspector():
-    return sa.inspect(get_bind())
+def reset_cache(*_args, **_kwargs) -> None:
+    """Forget cached reflection state; the schema may have changed since."""
+    _INSPECTOR_CACHE.clear()
+    _METADATA_CACHE.clear()
+    _dialect_name.cache_clear()
+    _columns.cache_clear()
+    _indexes.cache_clear()
+
+
+def _schema_changed(table_name: str) -> None:
+    """Drop the reflection state that DDL on ``table_name`` made stale."""
+    bind_id = id(get_bind())
+    _INSPECTOR_CACHE.pop(bind_id, None)
+    metadata = _METADATA_CACHE.get(bind_id)
+    if metadata is not None and table_name in metadata.tables:
+        metadata.remove(metadata.tables[table_name])
+    _columns.cache_clear()
+    _indexes.cache_clear()
+
+
+def _watch_invalidation(bind) -> None:
+    engine = bind.engine
+    if not sa.event.contains(engine, "invalidate", reset_cache):
+        sa.event.listen(engine, "invalidate", reset_cache)
+
+
+def inspector() -> Inspector:
+    bind = get_bind()
+    cached = _INSPECTOR_CACHE.get(id(bind))
+    if cached is None:
+        _watch_invalidation(bind)
+        cached = _INSPECTOR_CACHE[id(bind)] = sa.inspect(bind)
+    return cached
+
+
+@functools.lru_cache(maxsize=None)
+def _dialect_name(bind_id: int) -> str:
+    return get_bind().dialect.name
+
+
+def dialect_name() -> str:
+    return _dialect_name(id(get_bind()))
 
 
 def is_sqlite() -> bool:
-    return get_bind().engine.dialect.name == "sqlite"
+    return dialect_name() == "sqlite"
 
 
 def table_exists(table_name: str) -> bool:
-    return table_name in inspector().get_table_names()
+    return inspector().has_table(table_name)
+
+
+# Single-table reflection on purpose: outside PostgreSQL/Oracle the
+# get_multi_* variants list every table in the catalog first.
+@functools.lru_cache(maxsize=None)
+def _columns(bind_id: int, table_name: str) -> dict[str, dict]:
+    try:
+        return {col["name"]: col for col in inspector().get_columns(table_name)}
+    except sa.exc.NoSuchTableError:
+        return {}
+
+
+@functools.lru_cache(maxsize=None)
+def _indexes(bind_id: int, table_name: str) -> frozenset[str]:
+    try:
+        return frozenset(index["name"] for index in inspector().get_indexes(table_name))
+    except sa.exc.NoSuchTableError:
+        return frozenset()
+
+
+def table_columns_info(table_name: str) -> dict[str, dict]:
+    """Reflected columns of ``table_name`` by name (type, nullable, default...).
+
+    The returned mapping is shared by later callers; don't mutate it.
+    """
+    return _columns(id(get_bind()), table_name)
+
+
+def columns_of(table_name: str) -> frozenset[str]:
+    """Column names of ``table_name`` (empty if the table is missing)."""
+    return frozenset(table_columns_info(table_name))
+
+
+def indexes_of(table_name: str) -> frozenset[str]:
+    """Index names of ``table_name`` (empty if the table is missing)."""
+    return _indexes(id(get_bind()), table_name)
 
 
 def column_exists(table_name: str, column_name: str) -> bool:
-    return column_name in {col["name"] for col in inspector().get_columns(table_name)}
+    return column_name in columns_of(table_name)
 
 
 def index_exists(table_name: str, index_name: str) -> bool:
-    return any(index["name"] == index_name for index in inspector().get_indexes(table_name))
+    return index_name in indexes_of(table_name)
 
 
 def load_table(table_name: str) -> sa.Table:
-    metadata = sa.MetaData()
-    return sa.Table(table_name, metadata, autoload_with=get_bind())
+    """Reflect ``table_name`` once per connection; later calls reuse it."""
+    bind = get_bind()
+    metadata = _METADATA_CACHE.setdefault(id(bind), sa.MetaData())
+    table = metadata.tables.get(table_name)
+    if table is None:
+        table = sa.Table(table_name, metadata, autoload_with=inspector())
+    return table
+
+
+def _matching(table: sa.TableClause, filters: Mapping[str, object]) -> list:
+    return [table.c[column_name] == value for column_name, value in filters.items()]
 
 
-def row_exists(table_name: str, filters: Mapping[str, object] | None = None) -> bool:
+def row_exists(table: str | sa.TableClause, filters: Mapping[str, object] | None = None) -> bool:
+    """Check for a matching row; pass a table object to skip reflection."""
     filters = filters or {}
-    table = load_table(table_name)
-    stmt = sa.select(sa.func.count()).select_from(table)
-    for column_name, value in filters.items():
-        stmt = stmt.where(getattr(table.c, column_name) == value)
-    return bool(get_bind().scalar(stmt))
+    if isinstance(table, str):
+        table = load_table(table)
+    stmt = sa.select(sa.literal(1)).select_from(table).where(*_matching(table, filters)).limit(1)
+    return get_bind().scalar(stmt) is not None
 
 
-def ensure_bulk_insert(table: sa.Table, rows: Iterable[Mapping[str, object]]) -> None:
-    existing = row_exists(table.name)
-    if existing:
+def _typed_literal(value: object, type_: sa.types.TypeEngine) -> sa.ColumnElement:
+    # PostgreSQL reads untyped parameters in a SELECT list as text, which then
+    # won't insert into integer/enum/JSON/timestamp columns without a cast.
+    literal = sa.literal(value, type_=type_)
+    if isinstance(type_, sa.types.NullType):
+        return literal
+    return sa.cast(literal, type_)
+
+
+# Rows per INSERT; also keeps the UNION ALL below within SQLite's
+# 500-term compound SELECT limit.
+BULK_INSERT_CHUNK = 500
+
+
+def ensure_bulk_insert(
+    table: sa.TableClause,
+    rows: Iterable[Mapping[str, object]],
+    filters: Mapping[str, object] | None = None,
+) -> None:
+    """Insert ``rows`` only if ``table`` has no row matching ``filters``.
+
+    Without ``filters`` that means only into an empty table. Every row must
+    have the same keys, since they are inserted as one multi-row statement.
+
+    Seeds that fit in one chunk go out as a single ``INSERT ... WHERE NOT
+    EXISTS``; larger ones check once, then insert multi-row VALUES chunks.
+    """
+    filters = filters or {}
+    rows = list(rows)
+    if not rows:
+        return
+    names = list(rows[0])
+    if any(row.keys() != rows[0].keys() for row in rows):
+        raise ValueError(f"ensure_bulk_insert({table.name!r}): all rows must have the same keys")
+    if len(rows) > BULK_INSERT_CHUNK:
+        if row_exists(table, filters):
+            return
+        for start in range(0, len(rows), BULK_INSERT_CHUNK):
+            op.execute(table.insert().values(rows[start : start + BULK_INSERT_CHUNK]))
         return
-    op.bulk_insert(table, rows)
+    values = sa.union_all(
+        *(
+            sa.select(*(_typed_literal(row[name], table.c[name].type).label(name) for name in names))
+            for row in rows
+        )
+    ).subquery()
+    stmt = table.insert().from_select(
+        names,
+        sa.select(*values.c).where(~sa.exists().select_from(table).where(*_matching(table, filters))),
+    )
+    op.execute(stmt)
+
+
+# Schema-changing operations. They mirror ``op.*`` but keep the caches above
+# coherent, so use these instead of ``op`` alongside the existence checks.
+
+
+def safe_create_table(table_name: str, *columns, **kwargs) -> sa.Table:
+    table = op.create_table(table_name, *columns, **kwargs)
+    _schema_changed(table_name)
+    return table
+
+
+def safe_drop_table(table_name: str, **kwargs) -> None:
+    op.drop_table(table_name, **kwargs)
+    _schema_changed(table_name)
+
+
+def safe_add_column(table_name: str, column: sa.Column, **kwargs) -> None:
+    op.add_column(table_name, column, **kwargs)
+    _schema_changed(table_name)
+
+
+def safe_drop_column(table_name: str, column_name: str, **kwargs) -> None:
+    op.drop_column(table_name, column_name, **kwargs)
+    _schema_changed(table_name)
+
+
+def safe_create_index(index_name: str, table_name: str, columns, **kwargs) -> None:
+    op.create_index(index_name, table_name, columns, **kwargs)
+    _schema_changed(table_name)
+
+
+def safe_drop_index(index_name: str, table_name: str, **kwargs) -> None:
+    op.drop_index(index_name, table_name=table_name, **kwargs)
+    _schema_changed(table_name)
+
+
+@contextlib.contextmanager
+def safe_batch_alter_table(table_name: str, **kwargs) -> Iterator:
+    try:
+        with op.batch_alter_table(table_name, **kwargs) as batch:
+            yield batch
+    finally:
+        _schema_changed(table_name)
@@ -10,6 +10,16 @@ from __future__ import annotations
 from alembic import op
 import sqlalchemy as sa
 
+from app.db.migrations.safe_ops import (
+    columns_of,
+    dialect_name,
+    row_exists,
+    safe_add_column,
+    safe_batch_alter_table,
+    safe_drop_column,
+    table_columns_info,
+)
+
 
 revision = "0d1e2f3g4h5i"
 down_revision = "1ca5b0ca7ef0"
@@ -19,59 +29,66 @@ depends_on = None
 
 NEW_ROLE_ENUM = sa.Enum("standard", "reseller", "sudo", "full_access", name="adminrole")
 OLD_ROLE_ENUM = sa.Enum("standard", "sudo", "full_access", name="adminrole")
+# SQLite stores the role as plain text, before and after adding "reseller".
+SQLITE_ROLE_TYPE = sa.String(length=32)
+ADMINS_ROLE = sa.table("admins", sa.column("role"))
+
+
+def _role_accepts_reseller(role: dict) -> bool:
+    return "reseller" in getattr(role["type"], "enums", ())
 
 
-def _column_exists(inspector, table: str, column: str) -> bool:
-    return column in {col["name"] for col in inspector.get_columns(table)}
+def _role_is_current(dialect: str, role: dict) -> bool:
+    # SQLite keeps the role as plain text, so only the leftover default matters
+    widened = dialect == "sqlite" or _role_accepts_reseller(role)
+    return widened and role["default"] is None
 
 
 def upgrade() -> None:
-    bind = op.get_bind()
-    dialect = bind.dialect.name
-    inspector = sa.inspect(bind)
+    dialect = dialect_name()
+    role = table_columns_info("admins")["role"]
 
-    if not _column_exists(inspector, "services", "flow"):
-        op.add_column("services", sa.Column("flow", sa.String(length=255), nullable=True))
+    if "flow" not in columns_of("services"):
+        safe_add_column("services", sa.Column("flow", sa.String(length=255), nullable=True))
 
     if dialect == "postgresql":
         op.execute("ALTER TYPE adminrole ADD VALUE IF NOT EXISTS 'reseller'")
     elif dialect == "mysql":
-        op.execute(
-            "ALTER TABLE admins MODIFY COLUMN role "
-            "ENUM('standard','reseller','sudo','full_access') "
-            "NOT NULL DEFAULT 'standard'"
-        )
-    else:
-        with op.batch_alter_table("admins", recreate="always") as batch:
+        # ALGORITHM=INSTANT only covers values appended to an ENUM; inserting
+        # 'reseller' mid-list renumbers the stored values and always copies the
+        # table, so at least skip the copy when the column is already widened.
+        if not _role_accepts_reseller(role):
+            op.execute(
+                sa.text(
+                    "ALTER TABLE admins MODIFY COLUMN role "
+                    "ENUM('standard','reseller','sudo','full_access') "
+                    "NOT NULL DEFAULT 'standard'"
+                )
+            )
+    elif not _role_is_current(dialect, role):
+        # SQLite does not support ALTER TABLE ... ALTER COLUMN, so the batch
+        # recreates the table. Repair rows first so the copy only sees clean
+        # data, and change the type and drop the default within that single copy.
+        if dialect == "sqlite":
+            existing_type = new_type = SQLITE_ROLE_TYPE
+        else:
+            existing_type, new_type = OLD_ROLE_ENUM, NEW_ROLE_ENUM
+        # role is NOT NULL, so this only repairs databases that bypassed it;
+        # probe for such a row instead of rewriting the whole table
+        if row_exists(ADMINS_ROLE, {"role": None}):
+            op.execute("UPDATE admins SET role = 'standard' WHERE role IS NULL")
+        with safe_batch_alter_table("admins", recreate="always") as batch:
             batch.alter_column(
                 "role",
-                existing_type=OLD_ROLE_ENUM if dialect != "sqlite" else sa.String(length=32),
-                type_=NEW_ROLE_ENUM if dialect != "sqlite" else sa.String(length=32),
+                existing_type=existing_type,
+                type_=new_type,
                 existing_nullable=False,
-                server_default="standard",
+                server_default=None,
             )
-        op.execute("UPDATE admins SET role = COALESCE(role, 'standard')")
-        # SQLite does not support ALTER TABLE ... ALTER COLUMN
-        # Use a batch_alter_table which recreates the table and is supported
-        # There are different SQL dialects which handle removing defaults differently
-        if dialect == "sqlite":
-            with op.batch_alter_table("admins") as batch:
-                batch.alter_column(
-                    "role",
-                    existing_type=NEW_ROLE_ENUM if dialect != "sqlite" else sa.String(length=32),
-                    existing_nullable=False,
-                    server_default=None,
-                )
-        else:
-            op.alter_column("admins", "role", server_default=None)
 
 
 def downgrade() -> None:
-    bind = op.get_bind()
-    dialect = bind.dialect.name
-    inspector = sa.inspect(bind)
-
-    if _column_exists(inspector, "services", "flow"):
-        op.drop_column("services", "flow")
+    if "flow" in columns_of("services"):
+        safe_drop_column("services", "flow")
 
     # Can't safely remove enum value; skip
@@ -9,9 +9,12 @@ from alembic import op
 import sqlalchemy as sa
 
 from app.db.migrations.safe_ops import (
+    ensure_bulk_insert,
     index_exists,
-    load_table,
-    row_exists,
+    safe_create_index,
+    safe_create_table,
+    safe_drop_index,
+    safe_drop_table,
     table_exists,
 )
 
@@ -23,27 +26,34 @@ branch_labels = None
 depends_on = None
 
 
+# Lightweight stand-in for seeding, so an existing table needn't be reflected.
+SYSTEM_TABLE = sa.table(
+    "system",
+    sa.column("id", sa.Integer),
+    sa.column("uplink", sa.BigInteger),
+    sa.column("downlink", sa.BigInteger),
+)
+
+
 def upgrade() -> None:
     if not table_exists("system"):
-        table = op.create_table(
+        safe_create_table(
             "system",
             sa.Column("id", sa.Integer(), nullable=False),
             sa.Column("uplink", sa.BigInteger(), nullable=True),
             sa.Column("downlink", sa.BigInteger(), nullable=True),
             sa.PrimaryKeyConstraint("id"),
         )
-    else:
-        table = load_table("system")
 
     if not index_exists("system", "ix_system_id"):
-        op.create_index(op.f("ix_system_id"), "system", ["id"], unique=False)
+        safe_create_index(op.f("ix_system_id"), "system", ["id"], unique=False)
 
-    if not row_exists("system", {"id": 1}):
-        op.bulk_insert(table, [{"id": 1, "uplink": 0, "downlink": 0}])
+    ensure_bulk_insert(SYSTEM_TABLE, [{"id": 1, "uplink": 0, "downlink": 0}], {"id": 1})
 
 
 def downgrade() -> None:
+    if not table_exists("system"):
+        return
     if index_exists("system", "ix_system_id"):
-        op.drop_index(op.f("ix_system_id"), table_name="system")
-    if table_exists("system"):
-        op.drop_table("system")
+        safe_drop_index(op.f("ix_system_id"), "system")
+    safe_drop_table("system")
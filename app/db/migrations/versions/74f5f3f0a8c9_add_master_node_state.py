@@ -9,7 +9,7 @@ Create Date: 2025-11-03 12:00:00.000000
 import sqlalchemy as sa
 from alembic import op
 
-from app.db.migrations.safe_ops import row_exists, table_exists
+from app.db.migrations.safe_ops import row_exists, safe_create_table, safe_drop_table, table_exists
 
 
 # revision identifiers, used by Alembic.
@@ -21,7 +21,7 @@ depends_on = None
 
 def upgrade() -> None:
     if not table_exists("master_node_state"):
-        op.create_table(
+        safe_create_table(
             "master_node_state",
             sa.Column("id", sa.Integer(), primary_key=True),
             sa.Column("uplink", sa.BigInteger(), nullable=False, server_default="0"),
@@ -82,4 +82,4 @@ def upgrade() -> None:
 
 def downgrade() -> None:
     if table_exists("master_node_state"):
-        op.drop_table("master_node_state")
+        safe_drop_table("master_node_state")
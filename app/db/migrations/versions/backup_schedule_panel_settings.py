@@ -8,6 +8,13 @@ Create Date: 2025-11-20 12:00:00.000000
 from alembic import op
 import sqlalchemy as sa
 
+from app.db.migrations.safe_ops import (
+    columns_of,
+    safe_add_column,
+    safe_batch_alter_table,
+    table_exists,
+)
+
 
 # revision identifiers, used by Alembic.
 revision = "backup_schedule_panel"
@@ -17,41 +24,30 @@ depends_on = None
 
 
 def upgrade() -> None:
-    bind = op.get_bind()
-    inspector = sa.inspect(bind)
-    tables = set(inspector.get_table_names())
-
-    if "panel_settings" in tables:
-        panel_columns = {
-            column["name"] for column in inspector.get_columns("panel_settings")
-        }
-        
+    if table_exists("panel_settings"):
+        panel_columns = columns_of("panel_settings")
+
+        # Plain ADD COLUMN on every backend; a batch would make SQLite rebuild
+        # the table because of the SQL expression server_default.
         if "backup_enabled" not in panel_columns:
-            op.add_column(
+            safe_add_column(
                 "panel_settings",
-                sa.Column("backup_enabled", sa.Boolean(), nullable=False, server_default=sa.text("0"))
+                sa.Column("backup_enabled", sa.Boolean(), nullable=False, server_default=sa.text("0")),
             )
-        
+
         if "backup_cron_schedule" not in panel_columns:
-            op.add_column(
-                "panel_settings",
-                sa.Column("backup_cron_schedule", sa.String(255), nullable=True)
-            )
+            safe_add_column("panel_settings", sa.Column("backup_cron_schedule", sa.String(255), nullable=True))
 
 
 def downgrade() -> None:
-    bind = op.get_bind()
-    inspector = sa.inspect(bind)
-    tables = set(inspector.get_table_names())
-
-    if "panel_settings" in tables:
-        panel_columns = {
-            column["name"] for column in inspector.get_columns("panel_settings")
-        }
-        
-        if "backup_enabled" in panel_columns:
-            op.drop_column("panel_settings", "backup_enabled")
-        
-        if "backup_cron_schedule" in panel_columns:
-            op.drop_column("panel_settings", "backup_cron_schedule")
+    if table_exists("panel_settings"):
+        panel_columns = columns_of("panel_settings")
+
+        # SQLite recreates the table to drop columns; do both drops in one copy
+        with safe_batch_alter_table("panel_settings") as batch:
+            if "backup_enabled" in panel_columns:
+                batch.drop_column("backup_enabled")
+
+            if "backup_cron_schedule" in panel_columns:
+                batch.drop_column("backup_cron_schedule")
 
@@ -0,0 +1,207 @@
+import os
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from alembic import command
+from alembic.config import Config
+from alembic.operations import Operations
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import BigInteger, DateTime, Enum, Integer, column, create_engine, inspect, table, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.pool import StaticPool
+
+from app.db.migrations import safe_ops
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "app" / "db" / "migrations"
+MYSQL_URL = os.environ.get("SQLALCHEMY_DATABASE_URL", "")
+
+
+def make_config() -> Config:
+    # No ini file: env.py would otherwise reconfigure logging for the whole test run
+    cfg = Config()
+    cfg.set_main_option("script_location", str(MIGRATIONS_DIR))
+    return cfg
+
+
+@pytest.fixture(scope="session")
+def alembic_script_dir():
+    """Scan and import the revision files once for the whole session."""
+    cfg = make_config()
+    return cfg, ScriptDirectory.from_config(cfg)
+
+
+def run_migrations(engine, alembic_script_dir) -> None:
+    cfg, script = alembic_script_dir
+    with engine.connect() as conn:
+        cfg.attributes["connection"] = conn
+        try:
+            # command.upgrade() would otherwise parse the versions directory again
+            with patch.object(ScriptDirectory, "from_config", return_value=script):
+                command.upgrade(cfg, "head")
+        finally:
+            del cfg.attributes["connection"]
+        conn.commit()
+
+
+def run_migrations_from_url(url: str, alembic_script_dir) -> None:
+    """Let env.py build its own engine, as ``alembic upgrade head`` does."""
+    _, script = alembic_script_dir
+    cfg = make_config()
+    cfg.set_main_option("sqlalchemy.url", url)
+    with patch.object(ScriptDirectory, "from_config", return_value=script):
+        command.upgrade(cfg, "head")
+
+
+@pytest.fixture
+def memory_engine():
+    # StaticPool hands out the one connection every time, so the in-memory
+    # database survives across separate upgrade runs
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture(
+    params=[
+        "sqlite",
+        pytest.param(
+            "mysql",
+            marks=pytest.mark.skipif(not MYSQL_URL.startswith("mysql"), reason="MySQL database URL not configured"),
+        ),
+    ]
+)
+def database_engine(request):
+    if request.param == "mysql":
+        engine = create_engine(MYSQL_URL)
+        yield engine
+        engine.dispose()
+        return
+    yield request.getfixturevalue("memory_engine")
+
+
+def schema_snapshot(engine) -> dict:
+    """Reflect everything the assertions need in one pass."""
+    with engine.connect() as conn:
+        inspector = inspect(conn)
+        return {
+            "tables": set(inspector.get_table_names()),
+            "users_indexes": sorted(index["name"] for index in inspector.get_indexes("users")),
+            "services_columns": {col["name"] for col in inspector.get_columns("services")},
+            "system_rows": conn.execute(text("SELECT COUNT(*) FROM system")).scalar(),
+        }
+
+
+def test_migrations_no_duplicate_keys(database_engine, alembic_script_dir):
+    _, script = alembic_script_dir
+    run_migrations(database_engine, alembic_script_dir)
+    snapshot = schema_snapshot(database_engine)
+
+    assert {"alembic_version", "admins", "users", "services", "system"} <= snapshot["tables"]
+    assert len(snapshot["users_indexes"]) == len(set(snapshot["users_indexes"]))
+    assert "flow" in snapshot["services_columns"]
+    assert snapshot["system_rows"] == 1
+
+    with database_engine.connect() as conn:
+        assert MigrationContext.configure(conn).get_current_revision() == script.get_current_head()
+
+
+def test_migrations_rerun_is_noop(memory_engine, alembic_script_dir):
+    run_migrations(memory_engine, alembic_script_dir)
+    snapshot = schema_snapshot(memory_engine)
+
+    # Every revision guards its DDL, so a second run must leave the schema untouched
+    run_migrations(memory_engine, alembic_script_dir)
+    assert schema_snapshot(memory_engine) == snapshot
+
+
+def test_migrations_from_url_run_in_one_transaction(tmp_path, alembic_script_dir):
+    url = f"sqlite:///{tmp_path / 'migrations.db'}"
+    _, script = alembic_script_dir
+    head = script.get_revision(script.get_current_head())
+
+    def failing_upgrade():
+        safe_ops.columns_of("services")
+        raise RuntimeError("boom")
+
+    # A failure in the last revision must roll back the whole chain
+    with (
+        patch.object(head.module, "upgrade", side_effect=failing_upgrade),
+        pytest.raises(RuntimeError, match="boom"),
+    ):
+        run_migrations_from_url(url, alembic_script_dir)
+    # ...and must not leave reflection cached for a connection that is gone
+    assert not safe_ops._INSPECTOR_CACHE
+    assert safe_ops._columns.cache_info().currsize == 0
+    engine = create_engine(url)
+    assert inspect(engine).get_table_names() == []
+    engine.dispose()
+
+    run_migrations_from_url(url, alembic_script_dir)
+    engine = create_engine(url)
+    assert {"alembic_version", "admins", "users", "services", "system"} <= set(inspect(engine).get_table_names())
+    with engine.connect() as conn:
+        assert MigrationContext.configure(conn).get_current_revision() == script.get_current_head()
+    engine.dispose()
+
+
+SEED_TABLE = table("seed", column("id"), column("note"))
+
+
+@pytest.fixture
+def seed_conn(memory_engine):
+    with memory_engine.connect() as conn:
+        conn.execute(text("CREATE TABLE seed (id INTEGER PRIMARY KEY, note VARCHAR(32))"))
+        with Operations.context(MigrationContext.configure(conn)):
+            yield conn
+    safe_ops.reset_cache()
+
+
+def count_rows(conn, where: str = "1 = 1") -> int:
+    return conn.execute(text(f"SELECT COUNT(*) FROM seed WHERE {where}")).scalar()
+
+
+@pytest.mark.parametrize("count", [3, safe_ops.BULK_INSERT_CHUNK, 1201])
+def test_ensure_bulk_insert_only_seeds_once(seed_conn, count):
+    rows = [{"id": i, "note": None if i % 2 else f"row {i}"} for i in range(count)]
+
+    for _ in range(2):
+        safe_ops.ensure_bulk_insert(SEED_TABLE, rows)
+        assert count_rows(seed_conn) == count
+
+    assert count_rows(seed_conn, "note IS NULL") == count // 2
+
+
+def test_ensure_bulk_insert_filters_narrow_the_guard(seed_conn):
+    seed_conn.execute(text("INSERT INTO seed (id, note) VALUES (2, 'other')"))
+
+    safe_ops.ensure_bulk_insert(SEED_TABLE, [{"id": 1, "note": None}], {"id": 1})
+    safe_ops.ensure_bulk_insert(SEED_TABLE, [{"id": 1, "note": None}], {"id": 1})
+    assert count_rows(seed_conn) == 2
+
+    # Without filters any existing row blocks the seed
+    safe_ops.ensure_bulk_insert(SEED_TABLE, [{"id": 3, "note": None}])
+    assert count_rows(seed_conn) == 2
+
+
+def test_ensure_bulk_insert_rejects_mismatched_rows(seed_conn):
+    with pytest.raises(ValueError):
+        safe_ops.ensure_bulk_insert(SEED_TABLE, [{"id": 1, "note": "a"}, {"id": 2}])
+    assert count_rows(seed_conn) == 0
+
+
+def test_ensure_bulk_insert_casts_values_for_postgresql():
+    typed = table(
+        "typed",
+        column("id", Integer),
+        column("uplink", BigInteger),
+        column("role", Enum("standard", "sudo", name="adminrole")),
+        column("created_at", DateTime),
+    )
+    with patch.object(safe_ops.op, "execute") as execute:
+        safe_ops.ensure_bulk_insert(typed, [{"id": 1, "uplink": None, "role": "standard", "created_at": None}])
+
+    sql = str(execute.call_args.args[0].compile(dialect=postgresql.dialect()))
+    for cast in ("AS INTEGER)", "AS BIGINT)", "AS adminrole)", "AS TIMESTAMP WITHOUT TIME ZONE)"):
+        assert cast in sql